@@ -1,24 +1,60 @@
 import os
+import queue
+import re
 import uuid
-import time
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from ipaddress import ip_address
-from typing import Dict, Any, List, Optional
+from operator import itemgetter
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
 
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, Response, request
 from flask_cors import CORS
 
+from storage import InMemoryDeviceStore, RecordedStatus, RedisDeviceStore, StatusResult, TagChange, now_iso
+
 try:
     # Use flask-smorest for OpenAPI/Swagger UI generation
     from flask_smorest import Api
 except Exception:  # pragma: no cover
     Api = None  # Will raise at runtime if missing; requirements.txt updated accordingly
 
+try:
+    # Optional: shared device/status store for multi-worker deployments (REDIS_URL)
+    import redis
+except Exception:  # pragma: no cover
+    redis = None  # Will raise at runtime only if REDIS_URL is set
+
+
+# Fast path for plain dotted-quad IPv4 (no leading zeros, matching ipaddress)
+_OCTET = r"(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9])"
+_IPV4_RE = re.compile(rf"{_OCTET}\.{_OCTET}\.{_OCTET}\.{_OCTET}")
+
+# Maximum number of reachability probes in flight at once when a real probe is configured
+MAX_CONCURRENT_PROBES = 100
+
+# Maximum number of ids accepted by the batch lookup endpoints
+MAX_BATCH_IDS = 1000
+
+# Server-Sent Events: per-client buffer size and idle heartbeat interval
+SSE_QUEUE_SIZE = 256
+SSE_HEARTBEAT_SECONDS = 15
+
+# Device payload validation
+REQUIRED_FIELDS = ("name", "ip_address", "type", "location")
+ALLOWED_TYPES = frozenset(("router", "switch", "server", "other"))
+_TYPE_ERROR = f"type must be one of {sorted(ALLOWED_TYPES)}"
+
+# Fields accepted by the `sort` query parameter of GET /api/devices
+SORTABLE_FIELDS = frozenset(("name", "status", "type", "location"))
+
 
 # App configuration
 def create_app():
     """
-    Factory to create and configure the Flask application with in-memory storage.
+    Factory to create and configure the Flask application with in-memory storage,
+    or Redis-backed storage shared across workers when REDIS_URL is set.
     Uses environment variables for future MongoDB integration but does not require them at runtime.
 
     OpenAPI/Swagger:
@@ -49,61 +85,98 @@ def create_app():
     app.config["MONGODB_URL"] = os.getenv("MONGODB_URL", "")
     app.config["MONGODB_DB"] = os.getenv("MONGODB_DB", "")
     app.config["STATUS_CACHE_TTL_SECONDS"] = int(os.getenv("STATUS_CACHE_TTL_SECONDS", "10"))
-
-    # In-memory storage for devices
-    devices: Dict[str, Dict[str, Any]] = {}
-    # Basic cache for device status
-    status_cache: Dict[str, Dict[str, Any]] = {}
-
-    def now_iso() -> str:
-        return datetime.now(timezone.utc).isoformat()
+    app.config["REDIS_URL"] = os.getenv("REDIS_URL", "")
+    # Callable (ip -> (reachable, response_time_ms)) for real ICMP/TCP checks;
+    # None keeps the built-in simulator
+    app.config["REACHABILITY_PROBE"] = None
+
+    # Device and status storage: in-memory by default, Redis when configured
+    if app.config["REDIS_URL"]:
+        if redis is None:
+            raise RuntimeError("redis is required when REDIS_URL is set. Please install dependencies.")
+        store = RedisDeviceStore(
+            redis.Redis.from_url(app.config["REDIS_URL"]), app.config["STATUS_CACHE_TTL_SECONDS"]
+        )
+    else:
+        store = InMemoryDeviceStore(app.config["STATUS_CACHE_TTL_SECONDS"])
+    # Long-lived pool for REACHABILITY_PROBE calls; threads are started on first use.
+    # Under gevent workers the threads are patched into greenlets.
+    probe_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PROBES, thread_name_prefix="reachability-probe")
+    # Queues of connected status stream clients; each receives pre-encoded SSE frames
+    status_subscribers: Set["queue.Queue[bytes]"] = set()
+
+    def current_etag() -> str:
+        return store.state_tag()
+
+    def not_modified(etag: str) -> Optional[Response]:
+        """Return a 304 response if the client already holds this version."""
+        if not request.if_none_match.contains_weak(etag):
+            return None
+        resp = Response(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+
+    def with_etag(resp: Response, etag: str) -> Response:
+        resp.set_etag(etag, weak=True)
+        return resp
+
+    def ojson(data: Any, status: int = 200) -> Response:
+        """Serialize with orjson; much faster than jsonify for large device lists."""
+        return Response(orjson.dumps(data), status=status, mimetype="application/json")
+
+    def publish_status(event: bytes):
+        """Fan an encoded status transition out to stream clients, dropping any that fall behind."""
+        if not status_subscribers:
+            return
+        frame = b"data: " + event + b"\n\n"
+        for q in list(status_subscribers):
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                status_subscribers.discard(q)
+
+    def record_statuses(results: List[StatusResult]) -> Tuple[List[RecordedStatus], Optional[TagChange]]:
+        """Store check results and notify stream clients of any status transitions."""
+        recorded, tags = store.record_statuses(results)
+        for device, old, encoded in recorded:
+            if old != device["status"]:
+                publish_status(encoded)
+        return recorded, tags
 
     def validate_ip(ip: str) -> bool:
+        if _IPV4_RE.fullmatch(ip):
+            return True
         try:
             ip_address(ip)
             return True
         except Exception:
             return False
 
-    def has_duplicate_ip(ip: str, exclude_id: Optional[str] = None) -> bool:
-        for did, d in devices.items():
-            if exclude_id and did == exclude_id:
-                continue
-            if d.get("ip_address") == ip:
-                return True
-        return False
-
     def validate_device_payload(payload: Dict[str, Any], require_all: bool = True) -> (bool, Dict[str, str]):
         errors: Dict[str, str] = {}
-        required_fields = ["name", "ip_address", "type", "location"]
-        allowed_types = ["router", "switch", "server", "other"]
         # Required fields
-        for field in required_fields:
+        for field in REQUIRED_FIELDS:
             if require_all and not payload.get(field):
                 errors[field] = f"{field} is required"
+            # Every device field is a string; other JSON values (e.g. integers wider
+            # than 64 bits) could be stored but not serialized back
+            elif field in payload and not isinstance(payload[field], str):
+                errors[field] = f"{field} must be a string"
         # IP format
-        if "ip_address" in payload:
-            if not validate_ip(str(payload["ip_address"])):
+        if "ip_address" in payload and "ip_address" not in errors:
+            if not validate_ip(payload["ip_address"]):
                 errors["ip_address"] = "Invalid IP address"
         # Type allowed
-        if "type" in payload and payload["type"] not in allowed_types:
-            errors["type"] = f"type must be one of {allowed_types}"
+        if "type" in payload and (not isinstance(payload["type"], str) or payload["type"] not in ALLOWED_TYPES):
+            errors["type"] = _TYPE_ERROR
         return (len(errors) == 0), errors
 
-    def cache_status(device_id: str, status: str, response_time_ms: Optional[int] = None):
-        status_cache[device_id] = {
-            "status": status,
-            "last_checked": now_iso(),
-            "response_time_ms": response_time_ms,
-            "timestamp": time.time(),
-        }
-
-    def cached_status_valid(device_id: str) -> bool:
-        ttl = app.config["STATUS_CACHE_TTL_SECONDS"]
-        entry = status_cache.get(device_id)
-        if not entry:
-            return False
-        return (time.time() - entry.get("timestamp", 0)) <= ttl
+    def last_octet(ip: str) -> int:
+        try:
+            return int(ip.rsplit(".", 1)[-1])
+        except ValueError:
+            # Not a dotted IPv4 address (e.g. IPv6)
+            return 0
 
     def simulate_reachability(ip: str) -> (bool, Optional[int]):
         """
@@ -113,23 +186,61 @@ def create_app():
         - Otherwise unreachable
         - Response time randomized within a range to simulate latency
         """
+        last_num = last_octet(ip)
+        reachable = (last_num % 2 == 0)
+        response_time_ms = 20 + (last_num % 50)  # pseudo-latency
+        return reachable, response_time_ms if reachable else None
+
+    def run_probe(probe: Callable[[str], Tuple[bool, Optional[int]]], ip: str) -> Tuple[bool, Optional[int]]:
+        """One probe call; a probe that raises counts as unreachable instead of failing the whole request."""
         try:
-            parts = ip.split(".")
-            last = parts[-1]
-            last_num = int("".join([c for c in last if c.isdigit()]) or "0")
-            reachable = (last_num % 2 == 0)
-            response_time_ms = 20 + (last_num % 50)  # pseudo-latency
-            return reachable, response_time_ms if reachable else None
+            return probe(ip)
         except Exception:
             return False, None
 
+    def check_reachability(ips: List[str]) -> List[Tuple[bool, Optional[int]]]:
+        """
+        Reachability for each IP, in order. Uses REACHABILITY_PROBE concurrently when
+        configured, otherwise the simulator.
+        """
+        probe = app.config["REACHABILITY_PROBE"]
+        if probe is None or not ips:
+            return [simulate_reachability(ip) for ip in ips]
+        # Probes run on the shared pool so N network round trips overlap instead of adding up
+        return list(probe_executor.map(partial(run_probe, probe), ips))
+
+    def refresh_statuses(devs: List[Dict[str, Any]]) -> Tuple[Dict[str, bytes], Optional[TagChange]]:
+        """
+        Re-check every given device whose cached status is missing or expired.
+        Returns the encoded {id, status, last_checked} entry of each device, keyed by id,
+        and the state tags around the refresh's write (None if nothing was re-checked).
+        """
+        entries = store.fresh_statuses([d["id"] for d in devs])
+        stale = [d for d in devs if d["id"] not in entries]
+        probes = check_reachability([d["ip_address"] for d in stale])
+        results = [
+            (d["id"], "online" if reachable else "offline", rtt)
+            for d, (reachable, rtt) in zip(stale, probes)
+        ]
+        recorded, tags = record_statuses(results)
+        for device, _, encoded in recorded:
+            entries[device["id"]] = encoded
+        return entries, tags
+
+    def parse_id_list(payload: Any) -> Tuple[Optional[List[str]], Dict[str, str]]:
+        if not isinstance(payload, list) or not all(isinstance(i, str) for i in payload):
+            return None, {"ids": "Request body must be a JSON array of device ids"}
+        if len(payload) > MAX_BATCH_IDS:
+            return None, {"ids": f"At most {MAX_BATCH_IDS} ids per request"}
+        return payload, {}
+
     @app.route("/api/health", methods=["GET"])
     def health():
         """
         Health check route to verify backend is running.
         Returns 200 OK with simple JSON payload.
         """
-        return jsonify({"status": "ok", "service": "device-backend", "time": now_iso()}), 200
+        return ojson({"status": "ok", "service": "device-backend", "time": now_iso()}, 200)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices", methods=["GET"])
@@ -155,30 +266,44 @@ def create_app():
             name: sort
             schema:
               type: string
+              enum: [name, status, type, location]
             description: Sort by field (name, status, type, location)
         responses:
           200:
             description: List of devices
+          304:
+            description: Not modified since the ETag sent in If-None-Match
+          400:
+            description: Invalid sort field
         Returns:
           - 200 JSON array of devices
         """
-        devs: List[Dict[str, Any]] = list(devices.values())
         q_type = request.args.get("type")
         q_status = request.args.get("status")
         sort_field = request.args.get("sort")
 
-        if q_type:
-            devs = [d for d in devs if d.get("type") == q_type]
-        if q_status:
-            devs = [d for d in devs if d.get("status") == q_status]
+        if sort_field and sort_field not in SORTABLE_FIELDS:
+            return ojson({
+                "code": 400,
+                "message": "Invalid request",
+                "details": {"sort": f"sort must be one of {sorted(SORTABLE_FIELDS)}"},
+            }, 400)
+
+        etag = current_etag()
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        devs = store.find(q_type, q_status)
 
         if sort_field:
             try:
-                devs.sort(key=lambda x: str(x.get(sort_field, "")))
-            except Exception:
-                pass
+                devs.sort(key=itemgetter(sort_field))
+            except TypeError:
+                # Mixed value types; fall back to comparing string forms
+                devs.sort(key=lambda x: str(x[sort_field]))
 
-        return jsonify(devs), 200
+        return with_etag(ojson(devs, 200), etag)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices", methods=["POST"])
@@ -211,24 +336,50 @@ def create_app():
         payload = request.get_json(silent=True) or {}
         ok, errors = validate_device_payload(payload, require_all=True)
         if not ok:
-            return jsonify({"code": 400, "message": "Invalid request", "details": errors}), 400
-
-        ip = payload["ip_address"]
-        if has_duplicate_ip(ip):
-            return jsonify({"code": 409, "message": "Duplicate IP address", "details": {"ip_address": "Duplicate"}}), 409
+            return ojson({"code": 400, "message": "Invalid request", "details": errors}, 400)
 
-        did = str(uuid.uuid4())
+        did = uuid.uuid4().hex
         device = {
             "id": did,
             "name": payload["name"],
-            "ip_address": ip,
+            "ip_address": payload["ip_address"],
             "type": payload["type"],
             "location": payload["location"],
             "status": "unknown",
             "last_checked": None,
         }
-        devices[did] = device
-        return jsonify(device), 201
+        # Serialize before storing, so a device that can't be encoded is never stored
+        response = ojson(device, 201)
+        if not store.add(device):
+            return ojson({"code": 409, "message": "Duplicate IP address", "details": {"ip_address": "Duplicate"}}, 409)
+        return response
+
+    # PUBLIC_INTERFACE
+    @app.route("/api/devices/batch", methods=["POST"])
+    def batch_get_devices():
+        """
+        Retrieve several devices by ID in one request.
+        ---
+        tags:
+          - Devices
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: array
+                items: {type: string}
+        responses:
+          200:
+            description: Map of device id to device, null for unknown ids
+          400:
+            description: Invalid request
+        Returns 200 with {id: device | null}
+        """
+        ids, errors = parse_id_list(request.get_json(silent=True))
+        if ids is None:
+            return ojson({"code": 400, "message": "Invalid request", "details": errors}, 400)
+        return ojson(dict(zip(ids, store.get_many(ids))), 200)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices/<device_id>", methods=["GET"])
@@ -251,10 +402,10 @@ def create_app():
             description: Device not found
         Returns 200 with device JSON or 404 if not found.
         """
-        device = devices.get(device_id)
+        device = store.get(device_id)
         if not device:
-            return jsonify({"code": 404, "message": "Device not found"}), 404
-        return jsonify(device), 200
+            return ojson({"code": 404, "message": "Device not found"}, 404)
+        return ojson(device, 200)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices/<device_id>", methods=["PUT"])
@@ -292,30 +443,30 @@ def create_app():
           409:
             description: Duplicate IP
         """
-        if device_id not in devices:
-            return jsonify({"code": 404, "message": "Device not found"}), 404
+        device = store.get(device_id)
+        if not device:
+            return ojson({"code": 404, "message": "Device not found"}, 404)
 
         payload = request.get_json(silent=True) or {}
         ok, errors = validate_device_payload(payload, require_all=True)
         if not ok:
-            return jsonify({"code": 400, "message": "Invalid request", "details": errors}), 400
-
-        ip = payload["ip_address"]
-        if has_duplicate_ip(ip, exclude_id=device_id):
-            return jsonify({"code": 409, "message": "Duplicate IP address", "details": {"ip_address": "Duplicate"}}), 409
+            return ojson({"code": 400, "message": "Invalid request", "details": errors}, 400)
 
         # Update
-        device = devices[device_id]
-        device.update({
-            "name": payload["name"],
-            "ip_address": ip,
-            "type": payload["type"],
-            "location": payload["location"],
-        })
-        devices[device_id] = device
-        # Invalidate status cache if IP changed
-        status_cache.pop(device_id, None)
-        return jsonify(device), 200
+        changes = {field: payload[field] for field in REQUIRED_FIELDS}
+        # Compare types as well: True == 1 == 1.0, and devices stored before fields
+        # had to be strings may still hold other JSON values
+        if all(type(device[field]) is type(value) and device[field] == value for field, value in changes.items()):
+            # Nothing changed; skip the write so caches and ETags stay valid
+            return ojson(device, 200)
+        device = {**device, **changes}
+        replaced = store.replace(device)
+        if replaced is None:
+            # Deleted by another request since it was read above
+            return ojson({"code": 404, "message": "Device not found"}, 404)
+        if not replaced:
+            return ojson({"code": 409, "message": "Duplicate IP address", "details": {"ip_address": "Duplicate"}}, 409)
+        return ojson(device, 200)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices/<device_id>", methods=["DELETE"])
@@ -337,10 +488,8 @@ def create_app():
           404:
             description: Not found
         """
-        if device_id not in devices:
-            return jsonify({"code": 404, "message": "Device not found"}), 404
-        devices.pop(device_id, None)
-        status_cache.pop(device_id, None)
+        if store.remove(device_id) is None:
+            return ojson({"code": 404, "message": "Device not found"}, 404)
         return ("", 204)
 
     # PUBLIC_INTERFACE
@@ -354,21 +503,61 @@ def create_app():
         responses:
           200:
             description: Array of statuses
+          304:
+            description: Not modified since the ETag sent in If-None-Match
         Returns 200 with array of {id, status, last_checked}
         """
-        results: List[Dict[str, Any]] = []
-        for did, d in devices.items():
-            if cached_status_valid(did):
-                c = status_cache[did]
-                results.append({"id": did, "status": c["status"], "last_checked": c["last_checked"]})
-            else:
-                reachable, rtt = simulate_reachability(d["ip_address"])
-                status = "online" if reachable else "offline"
-                cache_status(did, status, rtt)
-                d["status"] = status
-                d["last_checked"] = status_cache[did]["last_checked"]
-                results.append({"id": did, "status": status, "last_checked": d["last_checked"]})
-        return jsonify(results), 200
+        # Read the tag before any status state, so a write landing while the body is
+        # built leaves the tag older than the body (an extra 200), never newer (a false 304)
+        etag = current_etag()
+        devs = store.all()
+        entries, tags = refresh_statuses(devs)
+        if tags is None:
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+        elif tags[0] == etag:
+            # Nothing else was written between reading the tag and the refresh's own bump
+            etag = tags[1]
+
+        # Entries are encoded when cached, so the response is assembled without re-serializing
+        body = b"[" + b",".join(entries[d["id"]] for d in devs if d["id"] in entries) + b"]"
+        return with_etag(Response(body, status=200, mimetype="application/json"), etag)
+
+    # PUBLIC_INTERFACE
+    @app.route("/api/devices/status/batch", methods=["POST"])
+    def batch_get_status():
+        """
+        Retrieve statuses for a subset of devices in one request.
+        ---
+        tags:
+          - Status
+        requestBody:
+          required: true
+          content:
+            application/json:
+              schema:
+                type: array
+                items: {type: string}
+        responses:
+          200:
+            description: Map of device id to status, null for unknown ids
+          400:
+            description: Invalid request
+        Returns 200 with {id: {id, status, last_checked} | null}
+        """
+        ids, errors = parse_id_list(request.get_json(silent=True))
+        if ids is None:
+            return ojson({"code": 400, "message": "Invalid request", "details": errors}, 400)
+
+        # Each device is looked up and probed once however often its id repeats
+        unique_ids = list(dict.fromkeys(ids))
+        entries, _ = refresh_statuses([d for d in store.get_many(unique_ids) if d])
+        results: Dict[str, Optional[orjson.Fragment]] = {}
+        for did in ids:
+            encoded = entries.get(did)
+            results[did] = orjson.Fragment(encoded) if encoded else None
+        return ojson(results, 200)
 
     # PUBLIC_INTERFACE
     @app.route("/api/devices/<device_id>/status", methods=["POST"])
@@ -391,16 +580,52 @@ def create_app():
             description: Device not found
         Returns 200 with {id, status, last_checked}
         """
-        device = devices.get(device_id)
+        device = store.get(device_id)
         if not device:
-            return jsonify({"code": 404, "message": "Device not found"}), 404
+            return ojson({"code": 404, "message": "Device not found"}, 404)
 
-        reachable, rtt = simulate_reachability(device["ip_address"])
+        reachable, rtt = check_reachability([device["ip_address"]])[0]
         status = "online" if reachable else "offline"
-        cache_status(device_id, status, rtt)
-        device["status"] = status
-        device["last_checked"] = status_cache[device_id]["last_checked"]
-        return jsonify({"id": device_id, "status": status, "last_checked": device["last_checked"]}), 200
+        recorded, _ = record_statuses([(device_id, status, rtt)])
+        if not recorded:
+            return ojson({"code": 404, "message": "Device not found"}, 404)
+        return Response(recorded[0][2], status=200, mimetype="application/json")
+
+    # PUBLIC_INTERFACE
+    @app.route("/api/devices/status/stream", methods=["GET"])
+    def stream_status():
+        """
+        Stream device status transitions as Server-Sent Events.
+        ---
+        tags:
+          - Status
+        responses:
+          200:
+            description: text/event-stream of {id, status, last_checked} events
+        An event is sent only when a device's status changes. Idle connections receive
+        a comment heartbeat; clients that fall too far behind are disconnected.
+        """
+        q: "queue.Queue[bytes]" = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        status_subscribers.add(q)
+
+        def gen():
+            try:
+                while True:
+                    try:
+                        frame = q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                    except queue.Empty:
+                        frame = b": heartbeat\n\n"
+                    if q not in status_subscribers:
+                        # Evicted as a slow consumer
+                        return
+                    yield frame
+            finally:
+                status_subscribers.discard(q)
+
+        resp = Response(gen(), mimetype="text/event-stream")
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
 
     # The OpenAPI JSON is automatically available at /api/openapi.json and Swagger UI at /api/docs
 
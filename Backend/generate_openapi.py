@@ -1,6 +1,8 @@
 import json
 import os
-from app import app, api  # import your Flask app and Api instance
+from app import app  # import your Flask app
+
+api = app.extensions["smorest_api"]  # Api instance registered by create_app
 
 with app.app_context():
     # flask-smorest stores the spec in api.spec
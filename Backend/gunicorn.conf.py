@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for serving the Device Management API in production.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+
+Without REDIS_URL, device and status data are held in memory per process, so a
+single worker is the default; concurrency comes from gevent's cooperative
+connections. Raise GUNICORN_WORKERS only together with REDIS_URL, and only if
+/api/devices/status/stream is not used: its subscribers live in the worker that
+accepted the connection, so they miss status changes recorded by other workers.
+"""
+import os
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '3001')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+worker_class = "gevent"
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
@@ -0,0 +1,439 @@
+"""
+Device and status storage backends for the Device Management API.
+
+Two interchangeable stores are provided:
+- InMemoryDeviceStore: process-local dicts (default, no external services)
+- RedisDeviceStore: shared state in Redis so several Gunicorn workers see the same inventory
+
+Both expose the same methods; app.py picks one based on REDIS_URL.
+"""
+import itertools
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+
+Device = Dict[str, Any]
+# (device id, status, response time in ms) as produced by a reachability check
+StatusResult = Tuple[str, str, Optional[int]]
+# (updated device, previous status, encoded status entry) returned after recording a check
+RecordedStatus = Tuple[Device, str, bytes]
+# State tags just before and just after a write's own version bump
+TagChange = Tuple[str, str]
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def encode_status(device_id: str, status: str, last_checked: str) -> bytes:
+    """JSON for one {id, status, last_checked} entry, encoded once when the status is cached."""
+    return orjson.dumps({"id": device_id, "status": status, "last_checked": last_checked})
+
+
+class InMemoryDeviceStore:
+    """
+    Process-local store. Devices and the status cache live in dicts, with
+    secondary indexes for IP uniqueness and type/status filtering.
+    """
+
+    def __init__(self, status_ttl: int):
+        self.status_ttl = status_ttl
+        self._devices: Dict[str, Device] = {}
+        # Basic cache for device status
+        self._status_cache: Dict[str, Dict[str, Any]] = {}
+        # Index of IP address -> device id for O(1) duplicate checks
+        self._ip_to_id: Dict[str, str] = {}
+        # Secondary indexes of type/status -> device ids for list filtering
+        self._by_type: Dict[str, Set[str]] = defaultdict(set)
+        self._by_status: Dict[str, Set[str]] = defaultdict(set)
+        # Creation sequence per device id, so filtered listings keep insertion order like all()
+        self._seq: Dict[str, int] = {}
+        self._next_seq = itertools.count()
+        # Version of device/status state, bumped on every mutation; used for ETags.
+        # The per-process prefix keeps tags from a previous process from matching.
+        self._tag_prefix = uuid.uuid4().hex[:8]
+        self._version = 0
+
+    def _bump(self):
+        self._version += 1
+
+    @staticmethod
+    def _reindex(index: Dict[str, Set[str]], device_id: str, old: Optional[str], new: Optional[str]):
+        if old == new:
+            return
+        if old is not None:
+            bucket = index.get(old)
+            if bucket is not None:
+                bucket.discard(device_id)
+                if not bucket:
+                    del index[old]
+        if new is not None:
+            index[new].add(device_id)
+
+    def state_tag(self) -> str:
+        return f"{self._tag_prefix}-{self._version}"
+
+    def get(self, device_id: str) -> Optional[Device]:
+        return self._devices.get(device_id)
+
+    def get_many(self, ids: Iterable[str]) -> List[Optional[Device]]:
+        devices = self._devices
+        return [devices.get(i) for i in ids]
+
+    def all(self) -> List[Device]:
+        return list(self._devices.values())
+
+    def find(self, type_: Optional[str] = None, status: Optional[str] = None) -> List[Device]:
+        devices, by_type, by_status = self._devices, self._by_type, self._by_status
+        # Membership checks first: empty buckets are deleted, and indexing the
+        # defaultdicts directly would otherwise create them again
+        if (type_ and type_ not in by_type) or (status and status not in by_status):
+            return []
+        if type_ and status:
+            ids = by_type[type_] & by_status[status]
+        elif type_:
+            ids = by_type[type_]
+        elif status:
+            ids = by_status[status]
+        else:
+            return list(devices.values())
+        return [devices[i] for i in sorted(ids, key=self._seq.__getitem__)]
+
+    def add(self, device: Device) -> bool:
+        """Insert a new device. Returns False if its IP address is already taken."""
+        did = device["id"]
+        ip = device["ip_address"]
+        if ip in self._ip_to_id:
+            return False
+        self._devices[did] = device
+        self._ip_to_id[ip] = did
+        self._seq[did] = next(self._next_seq)
+        self._by_type[device["type"]].add(did)
+        self._by_status[device["status"]].add(did)
+        self._bump()
+        return True
+
+    def replace(self, device: Device) -> Optional[bool]:
+        """
+        Store a new version of an existing device.
+        Returns False if its IP address is taken, None if the device no longer exists.
+        """
+        did = device["id"]
+        old = self._devices.get(did)
+        if old is None:
+            return None
+        ip = device["ip_address"]
+        owner = self._ip_to_id.get(ip)
+        if owner is not None and owner != did:
+            return False
+        if old["ip_address"] != ip:
+            self._ip_to_id.pop(old["ip_address"], None)
+            self._ip_to_id[ip] = did
+            # Status is derived from the IP only, so other edits keep the cached entry
+            self._status_cache.pop(did, None)
+        self._reindex(self._by_type, did, old["type"], device["type"])
+        self._devices[did] = device
+        self._bump()
+        return True
+
+    def remove(self, device_id: str) -> Optional[Device]:
+        device = self._devices.pop(device_id, None)
+        if device is None:
+            return None
+        self._ip_to_id.pop(device["ip_address"], None)
+        self._seq.pop(device_id, None)
+        self._reindex(self._by_type, device_id, device["type"], None)
+        self._reindex(self._by_status, device_id, device["status"], None)
+        self._status_cache.pop(device_id, None)
+        self._bump()
+        return device
+
+    def fresh_statuses(self, ids: Iterable[str]) -> Dict[str, bytes]:
+        """Encoded status entries for the given ids whose cache has not expired."""
+        # Snapshot the clock once per call rather than once per device
+        now = time.monotonic()
+        cache = self._status_cache
+        fresh: Dict[str, bytes] = {}
+        for did in ids:
+            c = cache.get(did)
+            if c and now < c["deadline"]:
+                fresh[did] = c["encoded"]
+        return fresh
+
+    def record_statuses(self, results: Iterable[StatusResult]) -> Tuple[List[RecordedStatus], Optional[TagChange]]:
+        """
+        Cache check results and copy them onto the devices.
+        Returns (updated device, previous status, encoded entry) for each device that still exists,
+        and the state tags around this write's version bump (None if nothing was written).
+        """
+        # One timestamp for the whole batch instead of formatting one per device
+        last_checked = now_iso()
+        # Expiry on the monotonic clock, so wall-clock jumps (NTP, manual changes) can't extend or cut it
+        deadline = time.monotonic() + self.status_ttl
+        updated: List[RecordedStatus] = []
+        for did, status, response_time_ms in results:
+            device = self._devices.get(did)
+            if device is None:
+                continue
+            encoded = encode_status(did, status, last_checked)
+            self._status_cache[did] = {
+                "status": status,
+                "last_checked": last_checked,
+                "response_time_ms": response_time_ms,
+                "deadline": deadline,
+                "encoded": encoded,
+            }
+            old = device["status"]
+            self._reindex(self._by_status, did, old, status)
+            device["status"] = status
+            device["last_checked"] = last_checked
+            updated.append((device, old, encoded))
+        if not updated:
+            return updated, None
+        self._bump()
+        return updated, (f"{self._tag_prefix}-{self._version - 1}", self.state_tag())
+
+
+class RedisDeviceStore:
+    """
+    Store shared across processes through Redis.
+
+    Keys (under `prefix`):
+    - {prefix}:device:{id}  device JSON
+    - {prefix}:ids          sorted set of ids scored by creation sequence
+    - {prefix}:seq          counter handing out the creation sequence
+    - {prefix}:ip           hash of IP address -> id
+    - {prefix}:type:{type}, {prefix}:status:{status}  sets of ids
+    - {prefix}:cached_status:{id}  encoded {id, status, last_checked}, expired by Redis after the TTL
+    - {prefix}:version      counter bumped on every mutation; used for ETags
+    - {prefix}:epoch        random tag set once with SETNX; changes when Redis loses its data,
+                            so a restarted counter can't repeat an old ETag
+
+    Read-modify-write operations run as WATCH/MULTI transactions, so concurrent
+    workers retry instead of overwriting each other's changes.
+    """
+
+    def __init__(self, client: Any, status_ttl: int, prefix: str = "devices"):
+        self.r = client
+        self.status_ttl = status_ttl
+        self.prefix = prefix
+        self._ids_key = f"{prefix}:ids"
+        self._seq_key = f"{prefix}:seq"
+        self._ip_key = f"{prefix}:ip"
+        self._version_key = f"{prefix}:version"
+        self._epoch_key = f"{prefix}:epoch"
+
+    def _device_key(self, device_id: str) -> str:
+        return f"{self.prefix}:device:{device_id}"
+
+    def _type_key(self, type_: str) -> str:
+        return f"{self.prefix}:type:{type_}"
+
+    def _status_key(self, status: str) -> str:
+        return f"{self.prefix}:status:{status}"
+
+    def _cached_status_key(self, device_id: str) -> str:
+        return f"{self.prefix}:cached_status:{device_id}"
+
+    @staticmethod
+    def _decode(value: Any) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def state_tag(self) -> str:
+        epoch, version = self.r.mget(self._epoch_key, self._version_key)
+        if epoch is None:
+            # First use, or the data was flushed / lost in a failover; whoever sets it first wins
+            self.r.setnx(self._epoch_key, uuid.uuid4().hex[:8])
+            epoch = self.r.get(self._epoch_key)
+        version = self._decode(version) if version is not None else "0"
+        return f"{self._decode(epoch)}-{version}"
+
+    def get(self, device_id: str) -> Optional[Device]:
+        blob = self.r.get(self._device_key(device_id))
+        return orjson.loads(blob) if blob is not None else None
+
+    def get_many(self, ids: Iterable[str]) -> List[Optional[Device]]:
+        keys = [self._device_key(i) for i in ids]
+        if not keys:
+            return []
+        return [orjson.loads(b) if b is not None else None for b in self.r.mget(keys)]
+
+    def _existing(self, ids: Iterable[Any]) -> List[Device]:
+        return [d for d in self.get_many(self._decode(i) for i in ids) if d is not None]
+
+    def all(self) -> List[Device]:
+        return self._existing(self.r.zrange(self._ids_key, 0, -1))
+
+    def _in_creation_order(self, ids: Iterable[Any]) -> List[Device]:
+        ids = list(ids)
+        if not ids:
+            return []
+        # Sets come back in arbitrary order; sort by the ids zset score like all() does
+        scores = self.r.zmscore(self._ids_key, ids)
+        ordered = sorted((s, i) for i, s in zip(ids, scores) if s is not None)
+        return self._existing(i for _, i in ordered)
+
+    def find(self, type_: Optional[str] = None, status: Optional[str] = None) -> List[Device]:
+        if type_ and status:
+            ids = self.r.sinter(self._type_key(type_), self._status_key(status))
+        elif type_:
+            ids = self.r.smembers(self._type_key(type_))
+        elif status:
+            ids = self.r.smembers(self._status_key(status))
+        else:
+            return self.all()
+        return self._in_creation_order(ids)
+
+    def _transaction(self, func: Callable[[Any], Any], *watches: str) -> Any:
+        """
+        Run func(pipe) under WATCH on `watches`, retrying if another worker changed them.
+        func reads through the pipe, calls pipe.multi(), then queues its writes.
+        """
+        return self.r.transaction(func, *watches, value_from_callable=True)
+
+    def add(self, device: Device) -> bool:
+        """Insert a new device. Returns False if its IP address is already taken."""
+        did = device["id"]
+        ip = device["ip_address"]
+        # Encode before claiming anything, so a device that can't be serialized leaves no trace
+        blob = orjson.dumps(device)
+        seq = self.r.incr(self._seq_key)
+
+        def insert(pipe) -> bool:
+            if pipe.hexists(self._ip_key, ip):
+                return False
+            pipe.multi()
+            pipe.hset(self._ip_key, ip, did)
+            pipe.set(self._device_key(did), blob)
+            pipe.zadd(self._ids_key, {did: seq})
+            pipe.sadd(self._type_key(device["type"]), did)
+            pipe.sadd(self._status_key(device["status"]), did)
+            pipe.incr(self._version_key)
+            return True
+
+        try:
+            return self._transaction(insert, self._ip_key)
+        except Exception:
+            # EXEC does not roll back; don't leave the IP claimed by a device that wasn't stored
+            owner = self.r.hget(self._ip_key, ip)
+            if owner is not None and self._decode(owner) == did and not self.r.exists(self._device_key(did)):
+                self.r.hdel(self._ip_key, ip)
+            raise
+
+    def replace(self, device: Device) -> Optional[bool]:
+        """
+        Store a new version of an existing device.
+        Returns False if its IP address is taken, None if the device no longer exists.
+        Status fields are owned by record_statuses, so the stored ones are kept (and copied onto `device`).
+        """
+        did = device["id"]
+        device_key = self._device_key(did)
+        ip = device["ip_address"]
+
+        def update(pipe) -> Optional[bool]:
+            blob = pipe.get(device_key)
+            if blob is None:
+                return None
+            old = orjson.loads(blob)
+            ip_changed = old["ip_address"] != ip
+            if ip_changed:
+                owner = pipe.hget(self._ip_key, ip)
+                if owner is not None and self._decode(owner) != did:
+                    return False
+            device["status"] = old["status"]
+            device["last_checked"] = old["last_checked"]
+            pipe.multi()
+            pipe.set(device_key, orjson.dumps(device))
+            if ip_changed:
+                pipe.hdel(self._ip_key, old["ip_address"])
+                pipe.hset(self._ip_key, ip, did)
+                # Status is derived from the IP only, so other edits keep the cached entry
+                pipe.delete(self._cached_status_key(did))
+            if old["type"] != device["type"]:
+                pipe.smove(self._type_key(old["type"]), self._type_key(device["type"]), did)
+            pipe.incr(self._version_key)
+            return True
+
+        return self._transaction(update, device_key, self._ip_key)
+
+    def remove(self, device_id: str) -> Optional[Device]:
+        device_key = self._device_key(device_id)
+
+        def delete(pipe) -> Optional[Device]:
+            blob = pipe.get(device_key)
+            if blob is None:
+                return None
+            device = orjson.loads(blob)
+            pipe.multi()
+            pipe.delete(device_key, self._cached_status_key(device_id))
+            pipe.zrem(self._ids_key, device_id)
+            pipe.hdel(self._ip_key, device["ip_address"])
+            pipe.srem(self._type_key(device["type"]), device_id)
+            pipe.srem(self._status_key(device["status"]), device_id)
+            pipe.incr(self._version_key)
+            return device
+
+        return self._transaction(delete, device_key)
+
+    def fresh_statuses(self, ids: Iterable[str]) -> Dict[str, bytes]:
+        """Encoded status entries for the given ids; Redis drops expired ones itself."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        blobs = self.r.mget([self._cached_status_key(i) for i in ids])
+        return {did: b for did, b in zip(ids, blobs) if b is not None}
+
+    def record_statuses(self, results: Iterable[StatusResult]) -> Tuple[List[RecordedStatus], Optional[TagChange]]:
+        """
+        Cache check results and copy them onto the devices.
+        Returns (updated device, previous status, encoded entry) for each device that still exists,
+        and the state tags around this write's version bump (None if nothing was written).
+        The response time is not kept in Redis since nothing reads it back.
+        """
+        # Last result per device wins, as with repeated writes to the in-memory store
+        statuses = {did: status for did, status, _ in results}
+        if not statuses:
+            return [], None
+        ids = list(statuses)
+        keys = [self._device_key(did) for did in ids]
+        ttl = self.status_ttl
+        # One timestamp for the whole batch instead of formatting one per device
+        last_checked = now_iso()
+
+        updated: List[RecordedStatus] = []
+
+        def write(pipe):
+            blobs = pipe.mget(keys)
+            updated.clear()  # Left over from an attempt that hit a WatchError
+            pipe.multi()
+            for did, key, blob in zip(ids, keys, blobs):
+                if blob is None:
+                    continue
+                device = orjson.loads(blob)
+                status = statuses[did]
+                encoded = encode_status(did, status, last_checked)
+                if ttl > 0:
+                    pipe.set(self._cached_status_key(did), encoded, ex=ttl)
+                old = device["status"]
+                if old != status:
+                    pipe.smove(self._status_key(old), self._status_key(status), did)
+                device["status"] = status
+                device["last_checked"] = last_checked
+                pipe.set(key, orjson.dumps(device))
+                updated.append((device, old, encoded))
+            if updated:
+                pipe.incr(self._version_key)
+                pipe.get(self._epoch_key)
+
+        replies = self.r.transaction(write, *keys)
+        if not updated:
+            return updated, None
+        version, epoch = replies[-2:]
+        if epoch is None:
+            return updated, None  # Epoch lost since the caller read its tag; no tag to offer
+        epoch = self._decode(epoch)
+        return updated, (f"{epoch}-{version - 1}", f"{epoch}-{version}")
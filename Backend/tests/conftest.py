@@ -0,0 +1,51 @@
+"""
+Shared fixtures. Store and API tests run against both backends; Redis is
+replaced by fakeredis so no server is needed.
+"""
+import fakeredis
+import pytest
+
+import app as app_module
+from storage import InMemoryDeviceStore, RedisDeviceStore
+from tests.helpers import STATUS_TTL
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, redis_client):
+    if request.param == "redis":
+        return RedisDeviceStore(redis_client, STATUS_TTL)
+    return InMemoryDeviceStore(STATUS_TTL)
+
+
+@pytest.fixture
+def make_app(redis_client, monkeypatch):
+    """Factory for apps on either backend; Redis apps share one fake server, like separate workers."""
+    monkeypatch.setenv("STATUS_CACHE_TTL_SECONDS", str(STATUS_TTL))
+    monkeypatch.setattr(app_module.redis.Redis, "from_url", lambda url: redis_client)
+
+    def make(backend):
+        if backend == "redis":
+            monkeypatch.setenv("REDIS_URL", "redis://test")
+        else:
+            monkeypatch.delenv("REDIS_URL", raising=False)
+        flask_app = app_module.create_app()
+        flask_app.config["TESTING"] = True
+        return flask_app
+
+    return make
+
+
+@pytest.fixture(params=["memory", "redis"])
+def app(request, make_app):
+    return make_app(request.param)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
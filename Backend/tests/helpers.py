@@ -0,0 +1,15 @@
+"""Helpers shared by the test modules."""
+
+STATUS_TTL = 60
+
+
+def make_device(device_id, ip, type_="router", status="unknown", name="edge"):
+    return {
+        "id": device_id,
+        "name": name,
+        "ip_address": ip,
+        "type": type_,
+        "location": "lab",
+        "status": status,
+        "last_checked": None,
+    }
@@ -0,0 +1,293 @@
+import orjson
+import pytest
+
+import app as app_module
+from storage import InMemoryDeviceStore, RedisDeviceStore
+
+HEARTBEAT = b": heartbeat\n\n"
+
+
+def new_device(client, ip, type_="router", name="edge"):
+    resp = client.post("/api/devices", json={"name": name, "ip_address": ip, "type": type_, "location": "lab"})
+    assert resp.status_code == 201, resp.data
+    return resp.get_json()
+
+
+@pytest.fixture
+def reachable(app):
+    """Configured probe backed by a dict of IP -> reachable (default True)."""
+    state = {}
+    app.config["REACHABILITY_PROBE"] = lambda ip: (True, 5) if state.get(ip, True) else (False, None)
+    return state
+
+
+def data_frames(stream, count):
+    """Next `count` SSE data payloads, skipping heartbeats."""
+    frames = []
+    for chunk in stream:
+        if chunk != HEARTBEAT:
+            assert chunk.startswith(b"data: ") and chunk.endswith(b"\n\n")
+            frames.append(orjson.loads(chunk[len(b"data: "):]))
+            if len(frames) == count:
+                break
+    return frames
+
+
+def test_health(client):
+    resp = client.get("/api/health")
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "ok"
+
+
+def test_create_get_delete(client):
+    device = new_device(client, "10.0.0.1")
+    assert device["status"] == "unknown"
+    assert client.get(f"/api/devices/{device['id']}").get_json() == device
+    assert client.delete(f"/api/devices/{device['id']}").status_code == 204
+    assert client.get(f"/api/devices/{device['id']}").status_code == 404
+    assert client.delete(f"/api/devices/{device['id']}").status_code == 404
+
+
+@pytest.mark.parametrize("payload, field", [
+    ({"ip_address": "10.0.0.1", "type": "router", "location": "lab"}, "name"),
+    ({"name": "a", "ip_address": "10.0.0.300", "type": "router", "location": "lab"}, "ip_address"),
+    ({"name": "a", "ip_address": 167772161, "type": "router", "location": "lab"}, "ip_address"),
+    ({"name": "a", "ip_address": "10.0.0.1", "type": "firewall", "location": "lab"}, "type"),
+    ({"name": "a", "ip_address": "10.0.0.1", "type": "router", "location": ["lab"]}, "location"),
+])
+def test_create_rejects_invalid_payload(client, payload, field):
+    resp = client.post("/api/devices", json=payload)
+    assert resp.status_code == 400
+    assert field in resp.get_json()["details"]
+
+
+def test_create_rejects_integer_too_wide_for_json_encoding(client):
+    body = b'{"name": 100000000000000000000, "ip_address": "10.0.0.1", "type": "router", "location": "lab"}'
+    resp = client.post("/api/devices", data=body, content_type="application/json")
+    assert resp.status_code == 400
+    assert resp.get_json()["details"] == {"name": "name must be a string"}
+    assert client.get("/api/devices").get_json() == []
+
+
+def test_create_rejects_duplicate_ip(client):
+    new_device(client, "10.0.0.1")
+    resp = client.post("/api/devices", json={"name": "b", "ip_address": "10.0.0.1", "type": "switch", "location": "x"})
+    assert resp.status_code == 409
+    assert len(client.get("/api/devices").get_json()) == 1
+
+
+def test_list_filters_keep_creation_order(client, reachable):
+    created = [new_device(client, f"10.0.0.{n}", type_="switch" if n % 3 == 0 else "router") for n in range(1, 13)]
+    reachable.update({d["ip_address"]: False for d in created[::2]})
+    client.get("/api/devices/status")
+
+    def listed(query):
+        return [d["id"] for d in client.get(f"/api/devices?{query}").get_json()]
+
+    routers = [d["id"] for d in created if d["type"] == "router"]
+    offline = [d["id"] for d in created[::2]]
+    assert listed("type=router") == routers
+    assert listed("status=offline") == offline
+    assert listed("type=router&status=offline") == [i for i in routers if i in offline]
+    assert listed("type=server") == []
+
+
+def test_list_sort(client):
+    for name, ip in [("b", "10.0.0.1"), ("c", "10.0.0.2"), ("a", "10.0.0.3")]:
+        new_device(client, ip, name=name)
+    assert [d["name"] for d in client.get("/api/devices?sort=name").get_json()] == ["a", "b", "c"]
+    resp = client.get("/api/devices?sort=ip_address")
+    assert resp.status_code == 400
+    assert "sort" in resp.get_json()["details"]
+
+
+def test_list_etag_and_not_modified(client):
+    new_device(client, "10.0.0.1")
+    first = client.get("/api/devices")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    cached = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    new_device(client, "10.0.0.2")
+    changed = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.get_json()) == 2
+
+
+def test_status_etag_reflects_refreshed_entries(client):
+    new_device(client, "10.0.0.2")
+    first = client.get("/api/devices/status")
+    assert first.status_code == 200
+    assert [e["status"] for e in first.get_json()] == ["online"]
+    # The cached entries are still fresh, so nothing is re-checked and the tag holds
+    again = client.get("/api/devices/status", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_status_etag_is_never_newer_than_body(make_app):
+    worker_a, worker_b = make_app("redis"), make_app("redis")
+    a, b = worker_a.test_client(), worker_b.test_client()
+    checked = new_device(a, "10.0.0.2")
+    b.post(f"/api/devices/{checked['id']}/status")
+    # No cached status yet, so worker A probes it on its next poll
+    new_device(a, "10.0.0.4")
+    worker_b.config["REACHABILITY_PROBE"] = lambda ip: (False, None)
+
+    def probe(ip):
+        # Worker B records a transition while worker A is building its response
+        b.post(f"/api/devices/{checked['id']}/status")
+        return True, 1
+
+    worker_a.config["REACHABILITY_PROBE"] = probe
+    first = a.get("/api/devices/status")
+    assert {e["id"]: e["status"] for e in first.get_json()}[checked["id"]] == "online"
+
+    again = a.get("/api/devices/status", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert {e["id"]: e["status"] for e in again.get_json()}[checked["id"]] == "offline"
+
+
+def test_update_device(client):
+    device = new_device(client, "10.0.0.1")
+    other = new_device(client, "10.0.0.2")
+    url = f"/api/devices/{device['id']}"
+    body = {"name": "core", "ip_address": "10.0.0.5", "type": "switch", "location": "dc"}
+
+    updated = client.put(url, json=body)
+    assert updated.status_code == 200
+    assert {k: updated.get_json()[k] for k in body} == body
+
+    duplicate = client.put(url, json={**body, "ip_address": other["ip_address"]})
+    assert duplicate.status_code == 409
+    assert client.put("/api/devices/missing", json=body).status_code == 404
+    assert client.put(url, json={**body, "name": 7}).status_code == 400
+
+
+def test_update_device_deleted_concurrently(client, monkeypatch):
+    device = new_device(client, "10.0.0.1")
+
+    def get_then_delete(store, device_id):
+        # Another request deletes the device right after this one reads it
+        found = store_get[type(store)](store, device_id)
+        store.remove(device_id)
+        return found
+
+    store_get = {cls: cls.get for cls in (InMemoryDeviceStore, RedisDeviceStore)}
+    for cls in store_get:
+        monkeypatch.setattr(cls, "get", get_then_delete)
+    body = {"name": "core", "ip_address": "10.0.0.1", "type": "router", "location": "dc"}
+    resp = client.put(f"/api/devices/{device['id']}", json=body)
+    assert resp.status_code == 404
+
+
+def test_noop_update_keeps_etag(client):
+    device = new_device(client, "10.0.0.1")
+    etag = client.get("/api/devices").headers["ETag"]
+    body = {k: device[k] for k in ("name", "ip_address", "type", "location")}
+
+    assert client.put(f"/api/devices/{device['id']}", json=body).status_code == 200
+    assert client.get("/api/devices", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/api/devices/{device['id']}", json={**body, "location": "moved"})
+    assert client.get("/api/devices", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_batch_get_devices(client):
+    device = new_device(client, "10.0.0.1")
+    resp = client.post("/api/devices/batch", json=[device["id"], "missing"])
+    assert resp.status_code == 200
+    assert resp.get_json() == {device["id"]: device, "missing": None}
+
+    assert client.post("/api/devices/batch", json={"ids": [device["id"]]}).status_code == 400
+    assert client.post("/api/devices/batch", json=[1, 2]).status_code == 400
+    too_many = ["x"] * (app_module.MAX_BATCH_IDS + 1)
+    assert client.post("/api/devices/batch", json=too_many).status_code == 400
+
+
+def test_batch_get_status(client, reachable):
+    up = new_device(client, "10.0.0.1")
+    down = new_device(client, "10.0.0.2")
+    reachable[down["ip_address"]] = False
+
+    resp = client.post("/api/devices/status/batch", json=[up["id"], down["id"], "missing"])
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["missing"] is None
+    assert body[up["id"]]["status"] == "online"
+    assert body[down["id"]]["status"] == "offline"
+    assert client.post("/api/devices/status/batch", json="nope").status_code == 400
+
+
+def test_batch_get_status_probes_repeated_ids_once(client, app):
+    device = new_device(client, "10.0.0.1")
+    calls = []
+    app.config["REACHABILITY_PROBE"] = lambda ip: calls.append(ip) or (True, 1)
+
+    resp = client.post("/api/devices/status/batch", json=[device["id"]] * app_module.MAX_BATCH_IDS)
+    assert resp.status_code == 200
+    assert list(resp.get_json()) == [device["id"]]
+    assert calls == [device["ip_address"]]
+
+
+def test_check_status(client, reachable):
+    device = new_device(client, "10.0.0.1")
+    resp = client.post(f"/api/devices/{device['id']}/status")
+    assert resp.status_code == 200
+    entry = resp.get_json()
+    assert entry["id"] == device["id"] and entry["status"] == "online"
+    assert client.get(f"/api/devices/{device['id']}").get_json()["status"] == "online"
+    assert client.post("/api/devices/missing/status").status_code == 404
+
+
+def test_failing_probe_marks_device_offline(client, app):
+    ok = new_device(client, "10.0.0.1")
+    broken = new_device(client, "10.0.0.2")
+
+    def probe(ip):
+        if ip == broken["ip_address"]:
+            raise OSError("host unreachable")
+        return True, 3
+
+    app.config["REACHABILITY_PROBE"] = probe
+    resp = client.get("/api/devices/status")
+    assert resp.status_code == 200
+    assert {e["id"]: e["status"] for e in resp.get_json()} == {ok["id"]: "online", broken["id"]: "offline"}
+
+
+def test_stream_sends_status_transitions(client, reachable, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_HEARTBEAT_SECONDS", 0.01)
+    device = new_device(client, "10.0.0.1")
+    resp = client.get("/api/devices/status/stream")
+    assert resp.mimetype == "text/event-stream"
+    stream = iter(resp.response)
+
+    client.post(f"/api/devices/{device['id']}/status")
+    # A repeated check without a transition is not sent
+    client.post(f"/api/devices/{device['id']}/status")
+    reachable[device["ip_address"]] = False
+    client.post(f"/api/devices/{device['id']}/status")
+
+    events = data_frames(stream, 2)
+    assert [(e["id"], e["status"]) for e in events] == [(device["id"], "online"), (device["id"], "offline")]
+    resp.close()
+
+
+def test_stream_evicts_slow_consumer(client, reachable, monkeypatch):
+    monkeypatch.setattr(app_module, "SSE_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(app_module, "SSE_QUEUE_SIZE", 2)
+    device = new_device(client, "10.0.0.1")
+    resp = client.get("/api/devices/status/stream")
+    stream = iter(resp.response)
+
+    # Three transitions overflow the two-frame queue of the idle subscriber
+    for up in (True, False, True):
+        reachable[device["ip_address"]] = up
+        client.post(f"/api/devices/{device['id']}/status")
+
+    # The stream ends instead of delivering the backlog
+    assert data_frames(stream, 3) == []
+    resp.close()
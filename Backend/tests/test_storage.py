@@ -0,0 +1,172 @@
+import orjson
+import pytest
+
+from storage import InMemoryDeviceStore, RedisDeviceStore
+from tests.helpers import STATUS_TTL, make_device
+
+
+def ids_of(devices):
+    return [d["id"] for d in devices]
+
+
+def test_add_get_remove(store):
+    device = make_device("a", "10.0.0.1")
+    assert store.add(device)
+    assert store.get("a") == device
+    assert store.get_many(["a", "missing"]) == [device, None]
+    assert store.remove("a") == device
+    assert store.get("a") is None
+    assert store.remove("a") is None
+    assert store.all() == []
+
+
+def test_add_rejects_duplicate_ip_until_removed(store):
+    assert store.add(make_device("a", "10.0.0.1"))
+    assert not store.add(make_device("b", "10.0.0.1"))
+    assert store.get("b") is None
+    store.remove("a")
+    assert store.add(make_device("b", "10.0.0.1"))
+
+
+def test_find_uses_type_and_status_indexes(store):
+    store.add(make_device("r1", "10.0.0.1", type_="router", status="online"))
+    store.add(make_device("s1", "10.0.0.2", type_="switch", status="online"))
+    store.add(make_device("r2", "10.0.0.3", type_="router", status="offline"))
+
+    assert ids_of(store.find("router")) == ["r1", "r2"]
+    assert ids_of(store.find(status="online")) == ["r1", "s1"]
+    assert ids_of(store.find("router", "offline")) == ["r2"]
+    assert store.find("server") == []
+    assert store.find("router", "unknown") == []
+    assert ids_of(store.find()) == ["r1", "s1", "r2"]
+
+
+def test_find_keeps_insertion_order(store):
+    # Ids chosen so that neither sorting nor set iteration would give creation order
+    created = [f"d{n:02d}" for n in range(30, 0, -1)]
+    for n, did in enumerate(created):
+        store.add(make_device(did, f"10.0.1.{n}"))
+    assert ids_of(store.find("router")) == created
+    assert ids_of(store.find(status="unknown")) == created
+    assert ids_of(store.find("router", "unknown")) == created
+
+
+def test_replace_moves_ip_and_type_indexes(store):
+    store.add(make_device("a", "10.0.0.1"))
+    store.add(make_device("b", "10.0.0.2"))
+
+    assert not store.replace({**store.get("a"), "ip_address": "10.0.0.2"})
+    assert store.get("a")["ip_address"] == "10.0.0.1"
+
+    assert store.replace({**store.get("a"), "ip_address": "10.0.0.3", "type": "server"})
+    assert store.get("a")["ip_address"] == "10.0.0.3"
+    assert ids_of(store.find("server")) == ["a"]
+    assert ids_of(store.find("router")) == ["b"]
+    # The old IP is free again
+    assert store.add(make_device("c", "10.0.0.1"))
+
+
+def test_replace_missing_device(store):
+    device = make_device("a", "10.0.0.1")
+    store.add(device)
+    store.remove("a")
+    assert store.replace({**device, "name": "renamed"}) is None
+    assert store.get("a") is None
+    assert store.add(make_device("b", "10.0.0.1"))
+
+
+def test_record_statuses_updates_status_index(store):
+    store.add(make_device("a", "10.0.0.1"))
+    store.add(make_device("b", "10.0.0.2"))
+
+    recorded, _ = store.record_statuses([("a", "online", 12), ("missing", "online", 3)])
+    assert [(d["id"], old) for d, old, _ in recorded] == [("a", "unknown")]
+    device, _, encoded = recorded[0]
+    assert orjson.loads(encoded) == {"id": "a", "status": "online", "last_checked": device["last_checked"]}
+    assert store.get("a")["status"] == "online"
+    assert ids_of(store.find(status="online")) == ["a"]
+    assert ids_of(store.find(status="unknown")) == ["b"]
+
+    assert store.fresh_statuses(["a", "b"]) == {"a": encoded}
+
+
+def test_record_statuses_last_result_wins(store):
+    store.add(make_device("a", "10.0.0.1"))
+    store.record_statuses([("a", "online", 1), ("a", "offline", None)])
+    assert store.get("a")["status"] == "offline"
+    assert store.find(status="online") == []
+    assert ids_of(store.find(status="offline")) == ["a"]
+
+
+def test_ip_change_drops_cached_status(store):
+    store.add(make_device("a", "10.0.0.1"))
+    store.record_statuses([("a", "online", 1)])
+    store.replace({**store.get("a"), "name": "renamed"})
+    assert "a" in store.fresh_statuses(["a"])
+    store.replace({**store.get("a"), "ip_address": "10.0.0.9"})
+    assert store.fresh_statuses(["a"]) == {}
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda client: InMemoryDeviceStore(0),
+    lambda client: RedisDeviceStore(client, 0),
+], ids=["memory", "redis"])
+def test_zero_ttl_never_serves_cached_status(make_store, redis_client):
+    store = make_store(redis_client)
+    store.add(make_device("a", "10.0.0.1"))
+    store.record_statuses([("a", "online", 1)])
+    assert store.fresh_statuses(["a"]) == {}
+
+
+def test_state_tag_changes_only_on_mutation(store):
+    tag = store.state_tag()
+    store.all()
+    store.find("router")
+    assert store.state_tag() == tag
+
+    store.add(make_device("a", "10.0.0.1"))
+    added = store.state_tag()
+    assert added != tag
+    store.record_statuses([("a", "online", 1)])
+    assert store.state_tag() != added
+
+
+def test_record_statuses_reports_tags_around_its_write(store):
+    store.add(make_device("a", "10.0.0.1"))
+    before = store.state_tag()
+    _, tags = store.record_statuses([("a", "online", 1)])
+    assert tags == (before, store.state_tag())
+    assert store.record_statuses([("missing", "online", 1)]) == ([], None)
+
+
+def test_redis_state_tag_survives_counter_reset(redis_client):
+    store = RedisDeviceStore(redis_client, STATUS_TTL)
+    before = store.state_tag()
+    assert store.state_tag() == before
+    redis_client.flushall()
+    # Same version number, but the new epoch keeps the old ETag from matching
+    assert store.state_tag() != before
+
+
+def test_redis_add_serializes_before_claiming_ip(redis_client):
+    store = RedisDeviceStore(redis_client, STATUS_TTL)
+    with pytest.raises(TypeError):
+        store.add(make_device("a", "10.0.0.1", name=object()))
+    assert redis_client.hget("devices:ip", "10.0.0.1") is None
+    assert store.add(make_device("b", "10.0.0.1"))
+
+
+def test_redis_replace_keeps_concurrently_recorded_status(redis_client):
+    store = RedisDeviceStore(redis_client, STATUS_TTL)
+    store.add(make_device("a", "10.0.0.1"))
+    stale = store.get("a")
+    # Another worker records a check between this worker's read and write
+    RedisDeviceStore(redis_client, STATUS_TTL).record_statuses([("a", "online", 1)])
+
+    renamed = {**stale, "name": "renamed"}
+    assert store.replace(renamed)
+    assert renamed["status"] == "online"
+    assert store.get("a")["name"] == "renamed"
+    assert store.get("a")["status"] == "online"
+    assert ids_of(store.find(status="online")) == ["a"]
+    assert store.find(status="unknown") == []